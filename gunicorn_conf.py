@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration for running the API with multiple uvicorn workers.
+UvicornWorker picks uvloop and httptools automatically when they are installed.
+Payments are only shared between workers when REDIS_URL is set, otherwise each
+worker keeps its own in-memory payments, so a single worker is run.
+"""
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+
+if os.environ.get("REDIS_URL"):
+    workers = int(os.environ.get("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+else:
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        raise RuntimeError("WEB_CONCURRENCY > 1 requires REDIS_URL, in-memory payments are not shared between workers")
@@ -1,10 +1,38 @@
+import os
 from typing import Dict
-from fastapi import FastAPI, HTTPException
+import httpx
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from .datamodels import PaymentRequest, PaymentResponse
-from .payment_processor import PaymentProcessor
+from .payment_processor import PaymentProcessor, BANK_BASE_URL
+from .payment_database import PaymentDatabase
 from pydantic import ValidationError
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+
+@app.on_event("startup")
+async def startup() -> None:
+    # One client for the whole app so bank calls reuse pooled keep-alive connections
+    app.state.bank_client = httpx.AsyncClient(
+        base_url=BANK_BASE_URL,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        timeout=5.0,
+        # HTTP/2 is negotiated over TLS (ALPN), so it only applies to an https bank;
+        # the plain-http simulator keeps using pooled HTTP/1.1 connections
+        http2=BANK_BASE_URL.startswith("https://"),
+    )
+    # Share payments across worker processes when a Redis URL is configured
+    redis_url = os.environ.get("REDIS_URL")
+    if redis_url:
+        await PaymentDatabase.connect(redis_url)
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await app.state.bank_client.aclose()
+    await PaymentDatabase.disconnect()
+
 
 @app.get("/")
 async def ping() -> Dict[str, str]:
@@ -21,9 +49,17 @@ Exceptions:
 """
 # POST /payments
 @app.post("/payments")
-async def create_payment(payment_request: PaymentRequest) -> PaymentResponse:
+async def create_payment(
+    payment_request: PaymentRequest,
+    request: Request,
+    background_tasks: BackgroundTasks
+) -> PaymentResponse:
     try:
-        return PaymentProcessor.process_payment(payment_request)
+        return await PaymentProcessor.process_payment(
+            payment_request,
+            request.app.state.bank_client,
+            background_tasks
+        )
     except ValueError as e:
         # Request validation / simulator 4xx mapping
         raise HTTPException(status_code=400, detail=str(e))
@@ -50,7 +86,7 @@ Exceptions:
 @app.get("/payments")
 async def get_payment(payment_id: str) -> PaymentResponse:
     try:
-        return PaymentProcessor.get_payment_details(payment_id)
+        return await PaymentProcessor.get_payment_details(payment_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="Payment not found")
     except Exception as e:
@@ -1,7 +1,14 @@
+import re
 from datetime import datetime
-from typing import Literal
+from functools import lru_cache
+from typing import Any, Dict, Literal, Optional, TypedDict
+import pycountry
 from pydantic import BaseModel, Field
 
+# ISO 4217 codes, loaded from pycountry once at import so lookups are a set membership test
+ISO_CURRENCY_CODES = frozenset(currency.alpha_3 for currency in pycountry.currencies)
+CARD_NUMBER_RE = re.compile(r'[0-9]{14,19}')
+
 
 class PaymentRequest(BaseModel):
     card_number: str = Field(
@@ -28,6 +35,24 @@ class PaymentRequest(BaseModel):
         description="Amount in cents, $0.01 would be supplied as 1"
     )
 
+    class Config:
+        frozen = True
+
+    @property
+    def card_last_four(self) -> str:
+        return self.card_number[-4:]
+
+    @property
+    def bank_payload(self) -> Dict[str, Any]:
+        # Bank simulator expects: card_number, expiry_date (MM/YYYY), currency, amount, cvv
+        return {
+            "card_number": self.card_number,
+            "expiry_date": f"{int(self.card_expiration_month):02d}/{self.card_expiration_year}",
+            "currency": self.currency,
+            "amount": int(self.amount),
+            "cvv": self.card_cvv
+        }
+
 class PaymentResponse(BaseModel):
     payment_id: str = Field(
         description="Payment ID generated by the payment gateway"
@@ -53,36 +78,53 @@ class PaymentResponse(BaseModel):
         description="Amount in cents, $0.01 would be supplied as 1"
     )
 
+    class Config:
+        # Stored payments are shared by every reader of the in-memory store
+        frozen = True
+
+class BankResponse(TypedDict, total=False):
+    # Body returned by the bank simulator; error_message is only set on failures
+    # (errorMessage for requests the simulator does not support at all)
+    authorized: bool
+    authorization_code: str
+    error_message: str
+    errorMessage: str
+
 class PaymentRequestValidator:
     @staticmethod
     def validate_card_number(card_number: str) -> bool:
-        import re
-        if len(card_number) < 14 or len(card_number) > 19:
-            return False
-        if not re.match(r'^[0-9]+$', card_number):
-            return False
-        return True
+        return CARD_NUMBER_RE.fullmatch(card_number) is not None
 
     @staticmethod
     def validate_card_expiration_month(card_expiration_month: str) -> bool:
         return int(card_expiration_month) >= 1 and int(card_expiration_month) <= 12
     
     @staticmethod
-    def validate_card_expiration_year(card_expiration_year: str) -> bool:
-        return int(card_expiration_year) >= datetime.now().year
+    def validate_card_expiration_year(card_expiration_year: str, current_year: Optional[int] = None) -> bool:
+        if current_year is None:
+            current_year = datetime.now().year
+        return int(card_expiration_year) >= current_year
     
     @staticmethod
-    def validate_card_expiration_date(card_expiration_month: str, card_expiration_year: str) -> bool:
-        if int(card_expiration_year) < datetime.now().year:
+    def validate_card_expiration_date(
+        card_expiration_month: str,
+        card_expiration_year: str,
+        current_year: Optional[int] = None,
+        current_month: Optional[int] = None
+    ) -> bool:
+        if current_year is None or current_month is None:
+            now = datetime.now()
+            current_year, current_month = now.year, now.month
+        if int(card_expiration_year) < current_year:
             return False
-        if int(card_expiration_year) == datetime.now().year and int(card_expiration_month) < datetime.now().month:
+        if int(card_expiration_year) == current_year and int(card_expiration_month) < current_month:
             return False
         return True
     
     @staticmethod
     def validate_currency(currency: str) -> bool:
-        import pycountry
-        return pycountry.currencies.get(alpha_3=currency) is not None
+        # pycountry lookups ignore case, so keep accepting lowercase codes
+        return currency.upper() in ISO_CURRENCY_CODES
     
     @staticmethod
     def validate_amount(amount: str) -> bool:
@@ -90,16 +132,41 @@ class PaymentRequestValidator:
     
     @staticmethod
     def validate_payment_request(payment_request: PaymentRequest) -> bool:
+        # Card number is checked uncached so PANs are never retained in the cache
         if not PaymentRequestValidator.validate_card_number(payment_request.card_number):
             return False
-        if not PaymentRequestValidator.validate_card_expiration_month(payment_request.card_expiration_month):
+        now = datetime.now()
+        return PaymentRequestValidator._validate_request_fields(
+            payment_request.card_expiration_month,
+            payment_request.card_expiration_year,
+            payment_request.currency,
+            payment_request.amount,
+            now.year,
+            now.month
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _validate_request_fields(
+        card_expiration_month: str,
+        card_expiration_year: str,
+        currency: str,
+        amount: str,
+        current_year: int,
+        current_month: int
+    ) -> bool:
+        # current_year/current_month are part of the cache key, so cached
+        # expiry results are not reused once the month rolls over
+        if not PaymentRequestValidator.validate_card_expiration_month(card_expiration_month):
             return False
-        if not PaymentRequestValidator.validate_card_expiration_year(payment_request.card_expiration_year):
+        if not PaymentRequestValidator.validate_card_expiration_year(card_expiration_year, current_year):
             return False
-        if not PaymentRequestValidator.validate_card_expiration_date(payment_request.card_expiration_month, payment_request.card_expiration_year):
+        if not PaymentRequestValidator.validate_card_expiration_date(
+            card_expiration_month, card_expiration_year, current_year, current_month
+        ):
             return False
-        if not PaymentRequestValidator.validate_currency(payment_request.currency):
+        if not PaymentRequestValidator.validate_currency(currency):
             return False
-        if not PaymentRequestValidator.validate_amount(payment_request.amount):
+        if not PaymentRequestValidator.validate_amount(amount):
             return False
         return True
@@ -1,41 +1,149 @@
 """
 Payment database for storing payment details.
 Use a in-memory database to mock the behavior of a real database.
+Payments are spread over shards, each guarded by its own lock for writes,
+so concurrent writers only contend when they hit the same shard.
+When connected to Redis, payments are stored there instead so that every
+worker process sees the same payments. Payments are never updated once saved,
+so recently read ones are kept in a small per-process LRU cache in front of Redis.
+Cached entries expire after a few seconds, since a delete or clear in one worker
+only evicts that worker's cache.
 """
-from typing import Dict, Optional
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
 from .datamodels import PaymentResponse
 
+SHARD_COUNT = 256
+REDIS_KEY_PREFIX = "pmt:"
+REDIS_MAX_CONNECTIONS = 50
+# Number of Redis payments cached per process, 0 disables the cache (as does a TTL of 0)
+REDIS_CACHE_SIZE = int(os.environ.get("PAYMENT_CACHE_SIZE", "1024"))
+# Seconds a cached payment is served before it is read from Redis again
+REDIS_CACHE_TTL = float(os.environ.get("PAYMENT_CACHE_TTL", "5"))
+
+
+def _shard_index(payment_id: str) -> int:
+    return hash(payment_id) & (SHARD_COUNT - 1)
+
+
+def _redis_key(payment_id: str) -> str:
+    return f"{REDIS_KEY_PREFIX}{payment_id}"
+
 
 class PaymentDatabase:
-    # In-memory storage: payment_id -> PaymentResponse
-    _payments: Dict[str, PaymentResponse] = {}
+    # In-memory storage: shard -> (payment_id -> PaymentResponse, write lock)
+    _shards: List[Tuple[Dict[str, PaymentResponse], Lock]] = [({}, Lock()) for _ in range(SHARD_COUNT)]
+    # Redis client, set by connect(); None means the in-memory shards are used
+    _redis: Optional[Any] = None
+    # LRU cache of payments read from or written to Redis: payment_id -> (PaymentResponse, expiry)
+    _redis_cache: "OrderedDict[str, Tuple[PaymentResponse, float]]" = OrderedDict()
 
     @classmethod
-    def save_payment(cls, payment: PaymentResponse) -> None:
-        cls._payments[payment.payment_id] = payment
+    def _cache_payment(cls, payment: PaymentResponse) -> None:
+        if REDIS_CACHE_SIZE <= 0 or REDIS_CACHE_TTL <= 0:
+            return
+        cls._redis_cache[payment.payment_id] = (payment, time.monotonic() + REDIS_CACHE_TTL)
+        cls._redis_cache.move_to_end(payment.payment_id)
+        if len(cls._redis_cache) > REDIS_CACHE_SIZE:
+            cls._redis_cache.popitem(last=False)
 
     @classmethod
-    def get_payment(cls, payment_id: str) -> Optional[PaymentResponse]:
-        return cls._payments.get(payment_id)
+    async def connect(cls, url: str) -> None:
+        import redis.asyncio as redis
+        pool = redis.ConnectionPool.from_url(url, max_connections=REDIS_MAX_CONNECTIONS)
+        cls._redis = redis.Redis(connection_pool=pool)
 
     @classmethod
-    def payment_exists(cls, payment_id: str) -> bool:
-        return payment_id in cls._payments
+    async def disconnect(cls) -> None:
+        if cls._redis is None:
+            return
+        await cls._redis.aclose(close_connection_pool=True)
+        cls._redis = None
+        cls._redis_cache.clear()
 
     @classmethod
-    def clear_all(cls) -> None:
-        cls._payments.clear()
+    async def save_payment(cls, payment: PaymentResponse) -> None:
+        if cls._redis is not None:
+            await cls._redis.set(_redis_key(payment.payment_id), payment.json())
+            cls._cache_payment(payment)
+            return
+        payments, lock = cls._shards[_shard_index(payment.payment_id)]
+        with lock:
+            payments[payment.payment_id] = payment
 
     @classmethod
-    def delete_payment(cls, payment_id: str) -> None:
-        if payment_id not in cls._payments:
+    async def get_payment(cls, payment_id: str) -> Optional[PaymentResponse]:
+        if cls._redis is not None:
+            cached = cls._redis_cache.get(payment_id)
+            if cached is not None:
+                payment, expiry = cached
+                if time.monotonic() < expiry:
+                    cls._redis_cache.move_to_end(payment_id)
+                    return payment
+                del cls._redis_cache[payment_id]
+            raw = await cls._redis.get(_redis_key(payment_id))
+            # Misses are not cached, another worker may save the payment later
+            if raw is None:
+                return None
+            payment = PaymentResponse.parse_raw(raw)
+            cls._cache_payment(payment)
+            return payment
+        # Single dict reads are atomic, so lookups skip the lock
+        payments, _ = cls._shards[_shard_index(payment_id)]
+        return payments.get(payment_id)
+
+    @classmethod
+    async def payment_exists(cls, payment_id: str) -> bool:
+        if cls._redis is not None:
+            return await cls._redis.exists(_redis_key(payment_id)) > 0
+        payments, _ = cls._shards[_shard_index(payment_id)]
+        return payment_id in payments
+
+    @classmethod
+    async def clear_all(cls) -> None:
+        if cls._redis is not None:
+            keys = [key async for key in cls._redis.scan_iter(match=f"{REDIS_KEY_PREFIX}*")]
+            if keys:
+                await cls._redis.delete(*keys)
+            cls._redis_cache.clear()
+            return
+        for payments, lock in cls._shards:
+            with lock:
+                payments.clear()
+
+    @classmethod
+    async def delete_payment(cls, payment_id: str) -> None:
+        if cls._redis is not None:
+            await cls._redis.delete(_redis_key(payment_id))
+            cls._redis_cache.pop(payment_id, None)
             return
-        del cls._payments[payment_id]
-    
+        payments, lock = cls._shards[_shard_index(payment_id)]
+        with lock:
+            payments.pop(payment_id, None)
+
     @classmethod
-    def get_all_payments(cls) -> Dict[str, PaymentResponse]:
-        return cls._payments.copy()
-    
+    async def get_all_payments(cls) -> Dict[str, PaymentResponse]:
+        if cls._redis is not None:
+            keys = [key async for key in cls._redis.scan_iter(match=f"{REDIS_KEY_PREFIX}*")]
+            if not keys:
+                return {}
+            # Fetch every payment in one round trip
+            pipe = cls._redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(key)
+            payments = [PaymentResponse.parse_raw(raw) for raw in await pipe.execute() if raw is not None]
+            return {payment.payment_id: payment for payment in payments}
+        all_payments: Dict[str, PaymentResponse] = {}
+        for payments, lock in cls._shards:
+            with lock:
+                all_payments.update(payments)
+        return all_payments
+
     @classmethod
-    def count(cls) -> int:
-        return len(cls._payments)
+    async def count(cls) -> int:
+        if cls._redis is not None:
+            return len([key async for key in cls._redis.scan_iter(match=f"{REDIS_KEY_PREFIX}*")])
+        return sum(len(payments) for payments, _ in cls._shards)
@@ -1,84 +1,118 @@
+import os
 from datetime import datetime
-from uuid import uuid4
-import pycountry
-from .datamodels import PaymentRequest, PaymentResponse, PaymentRequestValidator
+from typing import List, Optional
+from fastapi import BackgroundTasks
+from .datamodels import BankResponse, PaymentRequest, PaymentResponse, PaymentRequestValidator
 from .payment_database import PaymentDatabase
 import httpx
+import orjson
 
-BANK_ENDPOINT = "http://localhost:8080/payments"
+BANK_BASE_URL = os.environ.get("BANK_BASE_URL", "http://localhost:8080")
+BANK_PAYMENTS_PATH = "/payments"
+PAYMENT_ID_BATCH_SIZE = 256
+
+# Pre-generated random payment ids, refilled from one urandom call per batch
+_payment_id_pool: List[str] = []
+# A forked worker must not hand out the same ids as its parent (fork is Unix only)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_payment_id_pool.clear)
+
+
+def _gen_id() -> str:
+    if not _payment_id_pool:
+        pool = os.urandom(16 * PAYMENT_ID_BATCH_SIZE).hex()
+        _payment_id_pool.extend(pool[i:i + 32] for i in range(0, len(pool), 32))
+    return _payment_id_pool.pop()
+
+
+def _bank_error(data: BankResponse) -> Optional[str]:
+    return data.get("error_message") or data.get("errorMessage")
 
 
 class PaymentProcessor:
     """
     Payment processor for handling payment requests and bank simulator communication.
     Uses PaymentDatabase for storing payment details.
+    The bank client is shared across requests so connections are pooled.
+    Responses are built with construct() since every field is copied from the
+    already validated PaymentRequest, so validating them again is wasted work.
+    When background_tasks is given, rejected payments are saved after the response
+    is sent; bank results are always saved before returning so none can be lost.
     """
     @staticmethod
-    def process_payment(payment_request: PaymentRequest) -> PaymentResponse:
+    async def process_payment(
+        payment_request: PaymentRequest,
+        bank_client: httpx.AsyncClient,
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> PaymentResponse:
 
         # STEP 1: Validate the payment request, reject if not a valid request
         if not PaymentRequestValidator.validate_payment_request(payment_request):
-            payment_id = str(uuid4())
-            rejected_response = PaymentResponse(
+            payment_id = _gen_id()
+            rejected_response = PaymentResponse.construct(
                 payment_id=payment_id,
                 status="Rejected",
-                card_last_four=payment_request.card_number[-4:],    
+                card_last_four=payment_request.card_last_four,
                 card_expiration_month=payment_request.card_expiration_month,
                 card_expiration_year=payment_request.card_expiration_year,
                 currency=payment_request.currency,
                 amount=payment_request.amount
             )
-            # Store rejected payment in database
-            PaymentDatabase.save_payment(rejected_response)
+            # Store rejected payment in database, off the critical path when possible
+            if background_tasks is None:
+                await PaymentDatabase.save_payment(rejected_response)
+            else:
+                background_tasks.add_task(PaymentDatabase.save_payment, rejected_response)
             return rejected_response
 
         # STEP 2: Process the payment
         try:
-            # Convert PaymentRequest to bank simulator format
-            # Bank simulator expects: card_number, expiry_date (MM/YYYY), currency, amount, cvv
-            mm = str(int(payment_request.card_expiration_month)).zfill(2)
-            yyyy = payment_request.card_expiration_year
-            bank_payload = {
-                "card_number": payment_request.card_number,
-                "expiry_date": f"{mm}/{yyyy}",
-                "currency": payment_request.currency,
-                "amount": int(payment_request.amount),  # Convert to int for bank simulator
-                "cvv": payment_request.card_cvv
-            }
-            
-            response = httpx.post(
-                BANK_ENDPOINT,
-                json=bank_payload
+            # Serialize with orjson rather than httpx's stdlib json encoder
+            response = await bank_client.post(
+                BANK_PAYMENTS_PATH,
+                content=orjson.dumps(payment_request.bank_payload),
+                headers={"content-type": "application/json"}
             )
-            data = response.json()
-            auth = data.get("authorized")
-            auth_code = data.get("authorization_code")
-            if auth is None or auth_code is None or auth_code == "":
-                raise ValueError(f"Bank simulator returned an error: {data.get('error')}")
-
-            # Use authorization_code as payment_id, or generate one if not provided
-            payment_id = auth_code if auth_code else str(uuid4())
-            
-            payment_response = PaymentResponse(
-                payment_id=payment_id,
-                status="Authorized" if auth == True else "Declined",
-                card_last_four=payment_request.card_number[-4:],
-                card_expiration_month=payment_request.card_expiration_month,
-                card_expiration_year=payment_request.card_expiration_year,
-                currency=payment_request.currency,
-                amount=payment_request.amount
-            )
-            
-            # Store payment in database
-            PaymentDatabase.save_payment(payment_response)
-            
-            return payment_response
-        except Exception as e:
-            raise Exception(e)
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Bank simulator unavailable: {e}") from e
+
+        # A failing bank is not the client's fault, so it surfaces like a transport error
+        if response.status_code >= 500:
+            raise RuntimeError(f"Bank simulator unavailable: HTTP {response.status_code}")
+
+        # 4xx replies carry error_message and no authorized field
+        data: BankResponse = orjson.loads(response.content)
+        try:
+            auth = data["authorized"]
+        except KeyError:
+            raise ValueError(f"Bank simulator returned an error: {_bank_error(data)}")
+        if auth:
+            # Use authorization_code as payment_id
+            payment_id = data.get("authorization_code")
+            if not payment_id:
+                raise ValueError("Bank simulator authorized the payment without an authorization code")
+        else:
+            # Declines come back with an empty authorization_code
+            payment_id = _gen_id()
+
+        payment_response = PaymentResponse.construct(
+            payment_id=payment_id,
+            status="Authorized" if auth else "Declined",
+            card_last_four=payment_request.card_last_four,
+            card_expiration_month=payment_request.card_expiration_month,
+            card_expiration_year=payment_request.card_expiration_year,
+            currency=payment_request.currency,
+            amount=payment_request.amount
+        )
+
+        # Store payment in database before replying, the bank has already acted on it
+        await PaymentDatabase.save_payment(payment_response)
+
+        return payment_response
 
     @staticmethod
-    def get_payment_details(payment_id: str) -> PaymentResponse:
-        payment = PaymentDatabase.get_payment(payment_id)
+    async def get_payment_details(payment_id: str) -> PaymentResponse:
+        payment = await PaymentDatabase.get_payment(payment_id)
         if payment is None:
             raise KeyError(f"Payment not found: {payment_id}")
         
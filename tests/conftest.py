@@ -0,0 +1,23 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from payment_gateway_api.app import app
+from payment_gateway_api.payment_database import PaymentDatabase
+
+
+@pytest.fixture(scope="session")
+def client():
+    with pytest.MonkeyPatch.context() as mp:
+        # Keep the tests on the in-memory store even when REDIS_URL is exported
+        mp.delenv("REDIS_URL", raising=False)
+        # Entering the context runs the app's startup, which creates the bank client
+        with TestClient(app) as test_client:
+            yield test_client
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    asyncio.run(PaymentDatabase.clear_all())
+    yield
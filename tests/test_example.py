@@ -1,10 +1,4 @@
-from fastapi.testclient import TestClient
-from payment_gateway_api.app import app
-
-
-def test_example():
-    client = TestClient(app)
-
+def test_example(client):
     response = client.get("/")
 
     assert response.status_code == 200